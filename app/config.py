@@ -9,5 +9,20 @@ class Settings(BaseModel):
     api_key: str = Field(default=os.getenv("API_KEY", "ldc-100-secret-key"))
     host: str = Field(default=os.getenv("HOST", "0.0.0.0"))
     port: int = Field(default=int(os.getenv("PORT", "8000")))
+    # indici calcolati (es. coverage) persistiti su disco, fuori dalla sandbox dati
+    cache_dir: str = Field(default=os.getenv("CACHE_DIR", os.path.expanduser("~/.cache/ldc-100-data-api")))
+    # coverage: buchi più corti di così non vengono indicizzati (gap minore -> calcolo al volo)
+    coverage_min_gap: float = Field(default=float(os.getenv("COVERAGE_MIN_GAP", "60")))
+    # limite dei salti indicizzati per tabella: oltre, la soglia minima dell'indice viene alzata
+    coverage_max_breaks: int = Field(default=int(os.getenv("COVERAGE_MAX_BREAKS", "50000")))
+
+    # Profili di connessione SQLite: "archive" (file ruotati in archives/, mai più scritti)
+    # e "live" (DB corrente, scritto dal logger in WAL)
+    sqlite_archive_patterns: str = Field(default=os.getenv("SQLITE_ARCHIVE_PATTERNS", ""))  # glob extra, es. "*_old.db,backup_*"
+    sqlite_archive_immutable: bool = Field(default=os.getenv("SQLITE_ARCHIVE_IMMUTABLE", "1") not in ("0", "false", "False"))
+    sqlite_archive_mmap_mb: int = Field(default=int(os.getenv("SQLITE_ARCHIVE_MMAP_MB", "256")))
+    sqlite_archive_cache_mb: int = Field(default=int(os.getenv("SQLITE_ARCHIVE_CACHE_MB", "64")))
+    sqlite_live_mmap_mb: int = Field(default=int(os.getenv("SQLITE_LIVE_MMAP_MB", "64")))
+    sqlite_live_cache_mb: int = Field(default=int(os.getenv("SQLITE_LIVE_CACHE_MB", "16")))
 
 settings = Settings()
@@ -0,0 +1,62 @@
+import json
+import math
+from typing import Any, Optional, Sequence
+
+import numpy as np
+from fastapi.responses import JSONResponse
+
+try:
+    import orjson
+except ImportError:  # fallback: json standard (più lento)
+    orjson = None
+
+
+def _default(obj: Any) -> Any:
+    if isinstance(obj, np.ndarray):
+        return np.where(np.isfinite(obj), obj, None).tolist() if obj.dtype.kind == "f" else obj.tolist()
+    if isinstance(obj, np.generic):
+        return obj.item()
+    if isinstance(obj, (bytes, bytearray, memoryview)):
+        return bytes(obj).decode()   # come jsonable_encoder
+    raise TypeError(f"Type is not JSON serializable: {type(obj).__name__}")
+
+
+def _finite(obj: Any) -> Any:
+    # NaN/±inf -> None (solo nel fallback, come fa orjson)
+    if isinstance(obj, float):
+        return obj if math.isfinite(obj) else None
+    if isinstance(obj, dict):
+        return {k: _finite(v) for k, v in obj.items()}
+    if isinstance(obj, (list, tuple)):
+        return [_finite(v) for v in obj]
+    if isinstance(obj, np.ndarray):
+        return _default(obj)
+    return obj
+
+
+class FastJSONResponse(JSONResponse):
+    """
+    Serializza direttamente tuple/liste/np.ndarray, senza il giro di jsonable_encoder.
+    Va restituita esplicitamente dall'endpoint (return FastJSONResponse(...)).
+    NaN/±inf -> null.
+    """
+
+    def render(self, content: Any) -> bytes:
+        if orjson is not None:
+            return orjson.dumps(content, default=_default, option=orjson.OPT_SERIALIZE_NUMPY)
+        try:
+            return json.dumps(content, default=_default, separators=(",", ":"), allow_nan=False).encode("utf-8")
+        except ValueError:
+            # float non finiti: secondo giro con sostituzione (raro, più lento)
+            return json.dumps(_finite(content), default=_default, separators=(",", ":"), allow_nan=False).encode("utf-8")
+
+
+def round_rows(rows: Sequence[Sequence[Any]], precision: Optional[int]) -> Sequence[Any]:
+    # arrotonda solo i float (le altre celle restano invariate)
+    if precision is None:
+        return rows
+    return [tuple(round(v, precision) if type(v) is float else v for v in r) for r in rows]
+
+
+def round_array(arr: np.ndarray, precision: Optional[int]) -> np.ndarray:
+    return arr if precision is None or arr.dtype.kind != "f" else np.round(arr, precision)
@@ -1,6 +1,8 @@
 from fastapi import APIRouter, Depends, Query, HTTPException
-from typing import Optional
+from typing import Literal, Optional
+from fastapi.concurrency import run_in_threadpool
 from ..security import require_api_key
+from ..responses import FastJSONResponse, round_array, round_rows
 from ..services import sqlite_service
 import numpy as np
 from datetime import datetime
@@ -12,7 +14,7 @@ router = APIRouter(prefix="/db", tags=["db"])
 async def db_meta(name: str, _=Depends(require_api_key)):
     return await sqlite_service.get_meta(name)
 
-@router.get("/{name}/preview")
+@router.get("/{name}/preview", response_class=FastJSONResponse)
 async def db_preview(
     name: str,
     table: str = Query(..., min_length=1),
@@ -20,10 +22,11 @@ async def db_preview(
     offset: int = Query(0, ge=0),
     order_by: Optional[str] = None,
     desc: bool = True,
+    precision: Optional[int] = Query(None, ge=0, le=15),   # cifre decimali dei float
     _=Depends(require_api_key),
 ):
     cols, rows, next_off = await sqlite_service.get_preview(name, table, limit, offset, order_by, desc)
-    return {"columns": cols, "rows": rows, "next_offset": next_off}
+    return FastJSONResponse({"columns": cols, "rows": round_rows(rows, precision), "next_offset": next_off})
 
 def _parse_iso_to_epoch(s: Optional[str]) -> Optional[float]:
     if not s:
@@ -32,7 +35,7 @@ def _parse_iso_to_epoch(s: Optional[str]) -> Optional[float]:
     s2 = s.replace("Z", "+00:00") if "Z" in s else s
     return datetime.fromisoformat(s2).timestamp()
 
-@router.get("/{name}/chart")
+@router.get("/{name}/chart", response_class=FastJSONResponse)
 async def db_chart(
     name: str,
     table: str,
@@ -42,6 +45,8 @@ async def db_chart(
     to_ts: Optional[str] = Query(None, alias="to"),
     down: str = Query("lttb", alias="downsample"),  # "lttb" | "minmax"
     points: int = 2000,           # target punti per serie
+    layout: Literal["points", "columnar"] = "points",  # "columnar": {"t": [...], "series": [{"name", "i", "y"}]}
+    precision: Optional[int] = Query(None, ge=0, le=15),   # cifre decimali dei valori y
     _=Depends(require_api_key),
 ):
     ycols = [c.strip() for c in y.split(",") if c.strip()]
@@ -58,38 +63,59 @@ async def db_chart(
     rows = data["rows"]              # [[t, v1, v2,...], ...]
 
     if not rows:
-        return {"series": []}
+        return {"t": [], "series": []} if layout == "columnar" else {"series": []}
 
-    ts = np.array([float(r[0]) for r in rows])
+    arr = await run_in_threadpool(sqlite_service.rows_to_array, rows)
+    ts = arr[:, 0]
+    if np.isnan(ts).any():
+        arr = arr[~np.isnan(ts)]
+        if arr.shape[0] == 0:
+            # nessun istante convertibile (es. colonna ISO testo): errore, non "nessun dato"
+            raise HTTPException(status_code=400, detail="time_col is not numeric")
+        ts = arr[:, 0]
+    Y = arr[:, 1:]
 
-    series = []
-    for j, col in enumerate(cols[1:], start=1):
-        vals = []
-        for r in rows:
-            v = r[j]
-            if v is None:
-                vals.append(np.nan)
-            else:
-                try:
-                    vals.append(float(v))
-                except Exception:
-                    vals.append(np.nan)
-        yarr = np.array(vals, dtype=float)
-        mask = ~np.isnan(yarr)
-        if mask.sum() == 0:
-            series.append({"name": col, "points": []})
-            continue
+    method = "lttb" if down == "lttb" else "minmax"
+    idx = await run_in_threadpool(ds.downsample_many, ts, Y, points, method)
 
-        xy = np.vstack([ts[mask], yarr[mask]]).T
-        if xy.shape[0] > points:
-            if down == "lttb":
-                xy_ds = ds.lttb(xy, points)
-            else:
-                buckets = max(1, points // 2)
-                xy_ds = ds.minmax_bucket(xy, buckets)
-        else:
-            xy_ds = xy
+    if layout == "columnar":
+        # tempo condiviso una sola volta; ogni serie referenzia i suoi istanti per indice
+        keep = np.unique(np.concatenate(idx)) if idx else np.empty(0, dtype=np.intp)
+        series = [
+            {"name": col, "i": np.searchsorted(keep, ix), "y": round_array(Y[ix, j], precision)}
+            for j, (col, ix) in enumerate(zip(cols[1:], idx))
+        ]
+        return FastJSONResponse({"t": ts[keep], "series": series})
 
-        series.append({"name": col, "points": xy_ds.tolist()})
+    # array numpy passati direttamente al serializzatore (niente .tolist())
+    series = [
+        {"name": col, "points": np.column_stack((ts[ix], round_array(Y[ix, j], precision)))}
+        for j, (col, ix) in enumerate(zip(cols[1:], idx))
+    ]
+    return FastJSONResponse({"series": series})
 
-    return {"series": series}
\ No newline at end of file
+@router.get("/{name}/stats")
+async def db_stats(
+    name: str,
+    table: str,
+    columns: Optional[str] = None,    # es. "temp,hum" (default: tutte le colonne numeriche)
+    time_col: str = "timeEpoch",
+    from_ts: Optional[str] = Query(None, alias="from"),
+    to_ts: Optional[str] = Query(None, alias="to"),
+    _=Depends(require_api_key),
+):
+    cols = [c.strip() for c in columns.split(",") if c.strip()] if columns else None
+    tfrom = _parse_iso_to_epoch(from_ts)
+    tto = _parse_iso_to_epoch(to_ts)
+    return await sqlite_service.get_stats(name, table, cols, time_col, tfrom, tto)
+
+
+@router.get("/{name}/coverage")
+async def db_coverage(
+    name: str,
+    table: str,
+    time_col: str = "timeEpoch",
+    gap: float = Query(300, gt=0),   # secondi: buchi più lunghi spezzano l'intervallo
+    _=Depends(require_api_key),
+):
+    return await sqlite_service.get_coverage(name, table, time_col, gap)
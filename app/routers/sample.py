@@ -2,10 +2,11 @@
 from fastapi import APIRouter, Depends, HTTPException, Query
 from typing import Literal, Optional
 from ..services import sqlite_service
+from ..responses import FastJSONResponse, round_rows
 
 router = APIRouter(prefix="/db", tags=["db-sample"])
 
-@router.get("/{name}/sample", summary="Sample rows (raw | 1h | 24h, first-per-bucket)")
+@router.get("/{name}/sample", summary="Sample rows (raw | 1h | 24h, first-per-bucket)", response_class=FastJSONResponse)
 async def sample_rows(
     name: str,
     table: str = Query(..., description="Nome tabella/view (es. measuresNormalized)"),
@@ -15,6 +16,7 @@ async def sample_rows(
     desc: bool = Query(True),
     limit: int = Query(100, ge=1, le=5000),
     offset: int = Query(0, ge=0),
+    precision: Optional[int] = Query(None, ge=0, le=15, description="Cifre decimali dei float"),
 ):
     try:
         result = await sqlite_service.sample_rows(
@@ -27,7 +29,8 @@ async def sample_rows(
             limit=limit,
             offset=offset,
         )
-        return result  # { "columns": [...], "rows": [[...], ...] }
+        result["rows"] = round_rows(result["rows"], precision)
+        return FastJSONResponse(result)  # { "columns": [...], "rows": [[...], ...] }
     except sqlite_service.DbValidationError as e:
         raise HTTPException(status_code=400, detail=str(e))
     except FileNotFoundError:
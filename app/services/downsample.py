@@ -1,58 +1,131 @@
 import numpy as np
+from typing import List, Optional, Tuple
 
-def lttb(xy: np.ndarray, threshold: int) -> np.ndarray:
+def lttb_indices(
+    x: np.ndarray, Y: np.ndarray, threshold: int, nan: Optional[np.ndarray] = None
+) -> Tuple[np.ndarray, Optional[np.ndarray]]:
     """
-    xy: Nx2 (x asc) -> <= threshold punti
+    x: (n,) asc, Y: (n, k) -> (indici (m, k) con m <= threshold, validità (m, k) o None).
+    Stesso algoritmo di lttb(), eseguito in blocco su tutte le k serie.
+    nan: maschera (n, k) dei valori mancanti (None = nessuno). I bucket sono sulle righe;
+    i NaN non entrano in medie e scelte, un bucket tutto NaN non produce punti (validità False).
+    Ogni colonna deve avere almeno un valore.
     """
-    n = xy.shape[0]
+    n, k = Y.shape
     if threshold <= 0 or threshold >= n:
-        return xy
+        return np.repeat(np.arange(n)[:, None], k, axis=1), None if nan is None else ~nan
+    cols = np.arange(k)
+    if nan is None:
+        Y0 = Y
+        a = np.zeros(k, dtype=np.intp)
+        last = np.full(k, n - 1, dtype=np.intp)
+    else:
+        Y0 = np.where(nan, 0.0, Y)
+        a = np.argmin(nan, axis=0)                     # primo valore presente
+        last = n - 1 - np.argmin(nan[::-1], axis=0)    # ultimo valore presente
+    if threshold < 3:
+        return np.vstack([a, last]), None
     bucket_size = (n - 2) / (threshold - 2)
-    a = 0
-    out = [xy[0]]
+    out = [a]
+    ok = [np.ones(k, dtype=bool)]
     for i in range(0, threshold - 2):
         start = int(np.floor((i + 1) * bucket_size)) + 1
         end = int(np.floor((i + 2) * bucket_size)) + 1
         if end > n: end = n
-        if start >= end: 
+        if start >= end:
             continue
-        bucket = xy[start:end]
-        avg_x = bucket[:, 0].mean()
-        avg_y = bucket[:, 1].mean()
 
         rstart = int(np.floor(i * bucket_size)) + 1
         rend = int(np.floor((i + 1) * bucket_size)) + 1
         if rend > n: rend = n
-        segment = xy[rstart:rend]
-        if segment.shape[0] == 0:
+        if rstart >= rend:
             continue
 
-        ax, ay = xy[a]
-        dx = segment[:, 0] - ax
-        dy1 = segment[:, 1] - ay
-        dy2 = avg_y - ay
-        areas = np.abs(dx * (dy1 - dy2))
-        a = rstart + int(np.argmax(areas))
-        out.append(xy[a])
-    out.append(xy[-1])
-    return np.array(out)
+        ax = x[a]
+        ay = Y0[a, cols]
+        dx = x[rstart:rend, None] - ax
+        dy1 = Y0[rstart:rend] - ay
+        if nan is None:
+            dy2 = Y[start:end].mean(axis=0) - ay
+            areas = np.abs(dx * (dy1 - dy2))
+            a = rstart + np.argmax(areas, axis=0)
+            out.append(a)
+            continue
+        cnt = (end - start) - nan[start:end].sum(axis=0)
+        # bucket successivo vuoto: si usa il punto d'ancoraggio come riferimento
+        dy2 = np.where(cnt > 0, Y0[start:end].sum(axis=0) / np.maximum(cnt, 1) - ay, 0.0)
+        areas = np.where(nan[rstart:rend], -1.0, np.abs(dx * (dy1 - dy2)))
+        best = rstart + np.argmax(areas, axis=0)
+        has = ~nan[best, cols]
+        a = np.where(has, best, a)
+        out.append(a)
+        ok.append(has)
+    out.append(last)
+    ok.append(np.ones(k, dtype=bool))
+    return np.vstack(out), None if nan is None else np.vstack(ok)
 
-def minmax_bucket(xy: np.ndarray, buckets: int) -> np.ndarray:
-    n = xy.shape[0]
+def minmax_indices(
+    x: np.ndarray, Y: np.ndarray, buckets: int, nan: Optional[np.ndarray] = None
+) -> Tuple[np.ndarray, Optional[np.ndarray]]:
+    """
+    x: (n,) asc, Y: (n, k) -> (indici (2*buckets, k): min e max per bucket in ordine di x,
+    validità o None). Con nan, i bucket senza valori per una colonna non sono validi.
+    """
+    n, k = Y.shape
     if buckets <= 0 or buckets * 2 >= n:
-        return xy
+        return np.repeat(np.arange(n)[:, None], k, axis=1), None if nan is None else ~nan
+    lo = Y if nan is None else np.where(nan, np.inf, Y)
+    hi = Y if nan is None else np.where(nan, -np.inf, Y)
     size = n // buckets
-    res = []
-    for i in range(buckets):
-        s = i * size
-        e = (i + 1) * size if i < buckets - 1 else n
-        chunk = xy[s:e]
-        if chunk.size == 0:
-            continue
-        ymin = chunk[np.argmin(chunk[:, 1])]
-        ymax = chunk[np.argmax(chunk[:, 1])]
-        if ymin[0] <= ymax[0]:
-            res.extend([ymin, ymax])
-        else:
-            res.extend([ymax, ymin])
-    return np.array(res)
+    head = (buckets - 1) * size
+    # bucket regolari via reshape (vista, nessuna copia), l'ultimo prende il resto
+    offs = (np.arange(buckets - 1) * size)[:, None]
+    imin = np.vstack([lo[:head].reshape(buckets - 1, size, k).argmin(axis=1) + offs, lo[head:].argmin(axis=0) + head])
+    imax = np.vstack([hi[:head].reshape(buckets - 1, size, k).argmax(axis=1) + offs, hi[head:].argmax(axis=0) + head])
+    first = np.where(x[imin] <= x[imax], imin, imax)
+    second = np.where(x[imin] <= x[imax], imax, imin)
+    res = np.empty((2 * buckets, k), dtype=np.intp)
+    res[0::2] = first
+    res[1::2] = second
+    if nan is None:
+        return res, None
+    return res, ~nan[res, np.arange(k)]
+
+def downsample_many(x: np.ndarray, Y: np.ndarray, points: int, method: str = "lttb") -> List[np.ndarray]:
+    """
+    x: (n,) asc, Y: (n, k) con NaN per i valori mancanti.
+    Ritorna, per ogni colonna, gli indici (in x) dei punti da tenere.
+    Tutte le colonne sono elaborate in un solo passaggio 2-D, anche con NaN sparsi.
+    """
+    k = Y.shape[1]
+    out: List[np.ndarray] = [np.empty(0, dtype=np.intp)] * k
+    nan = np.isnan(Y)
+    has_nan = nan.any(axis=0)
+    live = np.flatnonzero(~nan.all(axis=0))   # colonne tutte NaN -> nessun punto
+    if live.size == 0:
+        return out
+    if live.size < k:
+        Y, nan, has_nan = Y[:, live], nan[:, live], has_nan[live]
+    mask = nan if has_nan.any() else None
+    if method == "lttb":
+        idx, ok = lttb_indices(x, Y, points, mask)
+    else:
+        idx, ok = minmax_indices(x, Y, max(1, points // 2), mask)
+    for pos, j in enumerate(live):
+        col = idx[:, pos]
+        if has_nan[pos]:
+            if ok is not None:
+                col = col[ok[:, pos]]
+            if method == "lttb":
+                col = np.unique(col)   # primo/ultimo valore possono coincidere (anche con points < 3)
+        out[j] = col
+    return out
+
+def lttb(xy: np.ndarray, threshold: int) -> np.ndarray:
+    """
+    xy: Nx2 (x asc) -> <= threshold punti
+    """
+    return xy[lttb_indices(xy[:, 0], xy[:, 1:2], threshold)[0][:, 0]]
+
+def minmax_bucket(xy: np.ndarray, buckets: int) -> np.ndarray:
+    return xy[minmax_indices(xy[:, 0], xy[:, 1:2], buckets)[0][:, 0]]
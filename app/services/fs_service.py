@@ -1,3 +1,4 @@
+import os
 from pathlib import Path
 from datetime import datetime, timezone
 import mimetypes
@@ -77,9 +78,12 @@ def open_for_download(name: str) -> Tuple[Path, int, float, str]:
     if not p.exists() or not p.is_file():
         raise HTTPException(status_code=404, detail="File not found")
     st = p.stat()
+    return p, st.st_size, st.st_mtime, file_etag(p, st)
+
+def file_etag(p: Path, st: Optional[os.stat_result] = None) -> str:
     # ETag leggero: nome + size + mtime (va bene per cache/resume)
-    etag = f"\"{p.name}-{st.st_size}-{int(st.st_mtime)}\""
-    return p, st.st_size, st.st_mtime, etag
+    st = st or p.stat()
+    return f"\"{p.name}-{st.st_size}-{int(st.st_mtime)}\""
 
 
 def delete_file(name: str, if_match: Optional[str] = None) -> dict:
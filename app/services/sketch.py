@@ -0,0 +1,104 @@
+import numpy as np
+from typing import List, Optional, Sequence
+
+class QuantileSketch:
+    """
+    Sketch per quantili approssimati a memoria limitata (compattazione tipo KLL).
+    Il livello h contiene campioni di peso 2**h, al massimo k per livello:
+    memoria ~ k * log2(n / k), errore di rango ~ log2(n / k) / k.
+    """
+
+    def __init__(self, k: int = 2048, seed: Optional[int] = None):
+        self.k = k
+        self.n = 0
+        self.levels: List[np.ndarray] = [np.empty(0)]
+        self._rng = np.random.default_rng(seed)
+
+    def update(self, values: np.ndarray) -> None:
+        # values: 1-D, già senza NaN
+        if values.size == 0:
+            return
+        self.n += values.size
+        self.levels[0] = np.concatenate([self.levels[0], values])
+        h = 0
+        while h < len(self.levels):
+            buf = self.levels[h]
+            if buf.size <= self.k:
+                h += 1
+                continue
+            buf = np.sort(buf)
+            keep = np.empty(0)
+            if buf.size % 2:
+                # numero dispari: un elemento a caso resta a questo livello
+                j = int(self._rng.integers(buf.size))
+                keep = buf[j:j + 1]
+                buf = np.delete(buf, j)
+            promoted = buf[int(self._rng.integers(2))::2]
+            self.levels[h] = keep
+            if h + 1 == len(self.levels):
+                self.levels.append(np.empty(0))
+            self.levels[h + 1] = np.concatenate([self.levels[h + 1], promoted])
+            h += 1
+
+    def quantiles(self, qs: Sequence[float]) -> List[Optional[float]]:
+        if self.n == 0:
+            return [None for _ in qs]
+        vals = np.concatenate(self.levels)
+        wts = np.concatenate([np.full(lv.size, 2.0 ** h) for h, lv in enumerate(self.levels)])
+        order = np.argsort(vals, kind="mergesort")
+        vals = vals[order]
+        cum = np.cumsum(wts[order])
+        pos = np.searchsorted(cum, np.asarray(qs, dtype=float) * cum[-1], side="left")
+        return [float(vals[min(p, vals.size - 1)]) for p in pos]
+
+class ColumnStats:
+    """
+    Statistiche incrementali su k colonne: count, null, min, max, media, stddev (popolazione)
+    e quantili approssimati. update() riceve blocchi (m, k) con NaN per i valori mancanti.
+    """
+
+    def __init__(self, k: int, sketch_k: int = 2048):
+        self.count = np.zeros(k, dtype=np.int64)
+        self.nulls = np.zeros(k, dtype=np.int64)
+        self.min = np.full(k, np.inf)
+        self.max = np.full(k, -np.inf)
+        self.mean = np.zeros(k)
+        self.m2 = np.zeros(k)
+        self.sketches = [QuantileSketch(sketch_k) for _ in range(k)]
+
+    def update(self, arr: np.ndarray) -> None:
+        valid = ~np.isnan(arr)
+        c = valid.sum(axis=0)
+        self.nulls += arr.shape[0] - c
+        self.min = np.minimum(self.min, np.where(valid, arr, np.inf).min(axis=0))
+        self.max = np.maximum(self.max, np.where(valid, arr, -np.inf).max(axis=0))
+        cmean = np.where(valid, arr, 0.0).sum(axis=0) / np.maximum(c, 1)
+        cm2 = (np.where(valid, arr - cmean, 0.0) ** 2).sum(axis=0)
+        # merge (Chan et al.): stabile anche con offset grandi (es. epoch)
+        n = self.count + c
+        delta = cmean - self.mean
+        self.mean = self.mean + delta * c / np.maximum(n, 1)
+        self.m2 = self.m2 + cm2 + delta ** 2 * self.count * c / np.maximum(n, 1)
+        self.count = n
+        for j, sk in enumerate(self.sketches):
+            if c[j]:
+                sk.update(arr[valid[:, j], j])
+
+    def result(self, names: Sequence[str]) -> List[dict]:
+        out = []
+        for j, name in enumerate(names):
+            n = int(self.count[j])
+            p50, p95, p99 = self.sketches[j].quantiles([0.5, 0.95, 0.99])
+            out.append({
+                "name": name,
+                "count": n,
+                "nulls": int(self.nulls[j]),
+                "min": float(self.min[j]) if n else None,
+                "max": float(self.max[j]) if n else None,
+                "mean": float(self.mean[j]) if n else None,
+                "stddev": float(np.sqrt(self.m2[j] / n)) if n else None,
+                "p50": p50,
+                "p95": p95,
+                "p99": p99,
+            })
+        return out
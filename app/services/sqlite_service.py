@@ -1,8 +1,19 @@
 import aiosqlite
+import hashlib
+import json
+import os
+import numpy as np
+from collections import OrderedDict
 from pathlib import Path
 from typing import List, Tuple, Any, Dict, Optional
+from fnmatch import fnmatch
 from fastapi import HTTPException
-from ..services.fs_service import _safe_path
+from fastapi.concurrency import run_in_threadpool
+from ..config import settings
+from ..services.fs_service import _safe_path, BASE, file_etag
+from ..services.sketch import ColumnStats
+
+ARCHIVES_DIR = BASE / "archives"
 
 SQL_IDENT = set("abcdefghijklmnopqrstuvwxyzABCDEFGHIJKLMNOPQRSTUVWXYZ0123456789_")
 
@@ -15,12 +26,56 @@ def _db_path(name: str) -> Path:
         raise HTTPException(status_code=400, detail="Not a sqlite file")
     return p
 
+def _has_wal(path: Path) -> bool:
+    # -wal non vuoto = transazioni non ancora riportate nel file principale
+    try:
+        return path.with_name(path.name + "-wal").stat().st_size > 0
+    except OSError:
+        return False
+
+def _is_archive(path: Path) -> bool:
+    # Archivio = file sotto archives/ oppure che corrisponde a un pattern in config,
+    # purché senza -wal pendente (rotazione senza checkpoint): in quel caso è trattato come live
+    patterns = [p.strip() for p in settings.sqlite_archive_patterns.split(",") if p.strip()]
+    if ARCHIVES_DIR not in path.parents and not any(fnmatch(path.name, p) for p in patterns):
+        return False
+    return not _has_wal(path)
+
+def _profile(archive: bool) -> Dict[str, Any]:
+    """
+    Profilo di connessione per classe di file.
+    - archive: immutable=1 (niente lock né change detection), mmap ampio
+    - live: sola lettura normale (il logger scrive in WAL), mmap/cache più contenuti
+    Un archivio con -wal non vuoto usa il profilo live: con immutable=1 SQLite ignorerebbe il WAL
+    (vedi _is_archive).
+    """
+    if archive:
+        return {
+            "immutable": settings.sqlite_archive_immutable,
+            "pragmas": {
+                "mmap_size": settings.sqlite_archive_mmap_mb * 1024 * 1024,
+                "cache_size": -settings.sqlite_archive_cache_mb * 1024,  # negativo = KiB
+                "temp_store": "MEMORY",
+            },
+        }
+    return {
+        "immutable": False,
+        "pragmas": {
+            "mmap_size": settings.sqlite_live_mmap_mb * 1024 * 1024,
+            "cache_size": -settings.sqlite_live_cache_mb * 1024,
+            "temp_store": "MEMORY",
+        },
+    }
+
 async def _connect_ro(path: Path) -> aiosqlite.Connection:
-    # read-only, condiviso, non blocca i writer (con WAL attivo)
-    uri = f"file:{path}?mode=ro&cache=shared"
-    # conn = await aiosqlite.connect(uri, uri=True)
+    # read-only, cache privata (cache=shared serializza i lettori sullo stesso file)
+    prof = _profile(_is_archive(path))
+    uri = f"file:{path}?mode=ro"
+    if prof["immutable"]:
+        uri += "&immutable=1"
     conn = await aiosqlite.connect(uri, uri=True, timeout=5.0)
-    # await conn.execute("PRAGMA busy_timeout = 3000")
+    for k, v in prof["pragmas"].items():
+        await conn.execute(f"PRAGMA {k} = {v}")
     return conn
 
 
@@ -108,7 +163,7 @@ async def get_meta(name: str) -> Dict[str, Any]:
 
 async def get_preview(
     name: str, table: str, limit: int, offset: int, order_by: Optional[str], desc: bool
-) -> Tuple[List[str], List[List[Any]], Optional[int]]:
+) -> Tuple[List[str], List[Tuple[Any, ...]], Optional[int]]:
     if not _ok_ident(table):
         raise HTTPException(status_code=400, detail="Invalid table")
     if order_by and not _ok_ident(order_by):
@@ -128,7 +183,7 @@ async def get_preview(
     order_clause = f" ORDER BY {order_by} {'DESC' if desc else 'ASC'}" if order_by else ""
     q = f"SELECT * FROM '{table}'{order_clause} LIMIT ? OFFSET ?"
     async with db.execute(q, (limit, offset)) as cur:
-        rows = [list(r) async for r in cur]
+        rows = await cur.fetchall()
     next_offset = offset + len(rows) if len(rows) == limit else None
     return cols, rows, next_offset
 
@@ -163,13 +218,308 @@ async def get_chart(
     db = await _connect_ro(path)
     try:
         async with db.execute(q, params) as cur:
-            rows = [list(r) async for r in cur]
+            rows = await cur.fetchall()     # tuple: vanno dritte in np.array
     finally:
         await db.close()
 
     return {"columns": select_cols, "rows": rows}
 
 
+def rows_to_array(rows: List[Tuple[Any, ...]]) -> np.ndarray:
+    # (n_rows, n_cols) float; None -> NaN
+    try:
+        return np.array(rows, dtype=float)
+    except (TypeError, ValueError):
+        # valori non numerici (es. testo): conversione cella per cella
+        def _f(v):
+            try:
+                return float(v)
+            except (TypeError, ValueError):
+                return np.nan
+        return np.array([[_f(v) for v in r] for r in rows], dtype=float)
+
+async def _table_columns(db: aiosqlite.Connection, table: str) -> List[Tuple[str, str]]:
+    # [(nome, tipo dichiarato MAIUSCOLO)], vuota se la tabella non esiste
+    info = []
+    async with db.execute(f"PRAGMA table_info('{table}')") as cur:
+        async for cid, cname, ctype, notnull, dflt, pk in cur:
+            info.append((cname, (ctype or "").upper()))
+    return info
+
+NUMERIC_AFFINITY = ("INT", "REAL", "FLOA", "DOUB", "NUM", "DEC")
+STATS_CHUNK = 50000
+# cache statistiche per archivi (immutabili): chiave con ETag del file
+_STATS_CACHE: "OrderedDict[tuple, Dict[str, Any]]" = OrderedDict()
+_STATS_CACHE_MAX = 256
+
+async def get_stats(
+    name: str,
+    table: str,
+    columns: Optional[List[str]],
+    time_col: str,
+    tfrom: Optional[float],
+    tto: Optional[float],
+) -> Dict[str, Any]:
+    if not _ok_ident(table) or not _ok_ident(time_col):
+        raise HTTPException(status_code=400, detail="Invalid identifiers")
+    if columns and not all(_ok_ident(c) for c in columns):
+        raise HTTPException(status_code=400, detail="Invalid columns")
+    if columns:
+        columns = list(dict.fromkeys(columns))   # niente duplicati, ordine invariato
+
+    path = _db_path(name)
+    if not path.exists():
+        raise HTTPException(status_code=404, detail="Database not found")
+    key = None
+    if _is_archive(path):
+        key = (str(path), file_etag(path), table, tuple(columns or ()), time_col, tfrom, tto)
+        hit = _STATS_CACHE.get(key)
+        if hit is not None:
+            _STATS_CACHE.move_to_end(key)
+            return hit
+
+    db = await _connect_ro(path)
+    try:
+        info = await _table_columns(db, table)
+        if not info:
+            raise HTTPException(status_code=404, detail="Table not found")
+        have = {c for c, _ in info}
+        if columns:
+            missing = [c for c in columns if c not in have]
+            if missing:
+                raise HTTPException(status_code=400, detail=f"Unknown columns: {', '.join(missing)}")
+            types = dict(info)
+            # tipo non numerico: sarebbe tutto NaN e sembrerebbe "solo null"
+            bad = [c for c in columns if not any(a in types[c] for a in NUMERIC_AFFINITY)]
+            if bad:
+                raise HTTPException(status_code=400, detail=f"Non-numeric columns: {', '.join(bad)}")
+            cols = columns
+        else:
+            cols = [c for c, t in info if any(a in t for a in NUMERIC_AFFINITY)]
+        if not cols:
+            raise HTTPException(status_code=400, detail="No numeric columns")
+        if (tfrom is not None or tto is not None) and time_col not in have:
+            raise HTTPException(status_code=400, detail="Invalid time_col")
+
+        texpr = _time_num_expr(time_col)
+        where = []
+        params: List[Any] = []
+        if tfrom is not None:
+            where.append(f"{texpr} >= ?")
+            params.append(tfrom)
+        if tto is not None:
+            where.append(f"{texpr} <= ?")
+            params.append(tto)
+        where_clause = (" WHERE " + " AND ".join(where)) if where else ""
+        q = f"SELECT {', '.join(cols)} FROM '{table}'{where_clause}"
+
+        # un solo passaggio: blocchi colonnari -> aggregati vettoriali + sketch quantili
+        acc = ColumnStats(len(cols))
+        rows_total = 0
+        async with db.execute(q, params) as cur:
+            while True:
+                chunk = await cur.fetchmany(STATS_CHUNK)
+                if not chunk:
+                    break
+                rows_total += len(chunk)
+                arr = await run_in_threadpool(rows_to_array, chunk)
+                await run_in_threadpool(acc.update, arr)
+    finally:
+        await db.close()
+
+    result = {"table": table, "rows": rows_total, "columns": acc.result(cols), "approx_percentiles": True}
+    if key is not None:
+        _STATS_CACHE[key] = result
+        if len(_STATS_CACHE) > _STATS_CACHE_MAX:
+            _STATS_CACHE.popitem(last=False)
+    return result
+
+# indice di copertura, uno per (file, tabella, colonna tempo), indipendente dal gap:
+# {"etag", "ino", "first", "last", "last_count" (righe a t == last), "rows",
+#  "min_gap", "breaks": [[fine, inizio], ...] con salto > min_gap}
+# breaks ha al massimo coverage_max_breaks voci: oltre, min_gap dell'indice viene alzato.
+# memoria (LRU limitata) + file JSON in settings.cache_dir
+_COVERAGE_CACHE: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+_COVERAGE_CACHE_MAX = 256
+
+def _coverage_file(key: str) -> Path:
+    return Path(settings.cache_dir) / f"coverage-{hashlib.sha1(key.encode()).hexdigest()}.json"
+
+def _coverage_load(key: str) -> Optional[Dict[str, Any]]:
+    state = _COVERAGE_CACHE.get(key)
+    if state is None:
+        try:
+            state = json.loads(_coverage_file(key).read_text())
+        except (OSError, ValueError):
+            return None
+        if not {"min_gap", "last_count"} <= state.keys():
+            return None   # formato precedente: si ricalcola
+    _coverage_remember(key, state)
+    return state
+
+def _coverage_remember(key: str, state: Dict[str, Any]) -> None:
+    _COVERAGE_CACHE[key] = state
+    _COVERAGE_CACHE.move_to_end(key)
+    if len(_COVERAGE_CACHE) > _COVERAGE_CACHE_MAX:
+        _COVERAGE_CACHE.popitem(last=False)
+
+def _coverage_save(key: str, state: Dict[str, Any]) -> None:
+    # un solo file per chiave: un nuovo ETag sovrascrive quello superato (eseguita nel threadpool)
+    f = _coverage_file(key)
+    try:
+        f.parent.mkdir(parents=True, exist_ok=True)
+        tmp = f.with_suffix(".tmp")
+        tmp.write_text(json.dumps(state))
+        os.replace(tmp, f)
+    except OSError as e:
+        # cache su disco non disponibile: resta quella in memoria
+        print(f"WARNING: coverage cache not persisted: {e}")
+
+async def _coverage_scan(
+    db: aiosqlite.Connection, table: str, texpr: str, min_gap: float, since: Optional[float]
+) -> Tuple[Optional[float], Optional[float], int, int, List[List[float]]]:
+    """
+    Un solo passaggio ordinato sul tempo (righe con t >= since se indicato).
+    Ritorna (primo, ultimo, righe lette, righe a t == ultimo, salti > min_gap).
+    Escono solo le righe d'inizio blocco, di salto e l'ultima (che porta anche i conteggi).
+    """
+    where = f"{texpr} IS NOT NULL" + (f" AND {texpr} >= ?" if since is not None else "")
+    q = f"""
+        SELECT t, prev, rn, rk, nxt IS NULL FROM (
+          SELECT {texpr} AS t,
+                 COALESCE(LAG({texpr}) OVER (ORDER BY {texpr}), ?) AS prev,
+                 LEAD({texpr}) OVER (ORDER BY {texpr}) AS nxt,
+                 ROW_NUMBER() OVER (ORDER BY {texpr}) AS rn,
+                 RANK() OVER (ORDER BY {texpr}) AS rk
+          FROM {table}
+          WHERE {where}
+        )
+        WHERE prev IS NULL OR t - prev > ? OR nxt IS NULL
+    """
+    params: List[Any] = [since] + ([since] if since is not None else []) + [min_gap]
+    first = last = None
+    rows = last_count = 0
+    breaks: List[List[float]] = []
+    async with db.execute(q, params) as cur:
+        async for t, prev, rn, rk, is_last in cur:
+            t = float(t)
+            if prev is None:
+                first = t
+            elif t - float(prev) > min_gap:
+                breaks.append([float(prev), t])
+            if is_last:
+                last, rows, last_count = t, rn, rn - rk + 1
+    return first, last, rows, last_count, breaks
+
+def _cap_breaks(breaks: List[List[float]], min_gap: float) -> Tuple[List[List[float]], float]:
+    # tiene i salti più lunghi: il nuovo min_gap è la lunghezza del primo escluso
+    limit = settings.coverage_max_breaks
+    if len(breaks) <= limit:
+        return breaks, min_gap
+    thr = sorted((b - a for a, b in breaks), reverse=True)[limit]
+    return [br for br in breaks if br[1] - br[0] > thr], max(min_gap, thr)
+
+async def get_coverage(name: str, table: str, time_col: str, gap: float) -> Dict[str, Any]:
+    """
+    Intervalli contigui di dati e buchi > gap secondi.
+    Archivi: indice calcolato una volta per ETag. DB live: esteso dall'ultimo istante coperto,
+    solo se la colonna tempo è usata così com'è (indicizzabile); con strftime() si ricalcola.
+    Il DB live viene ricalcolato da zero se cambia l'inode (rotazione) o MIN(tempo)
+    (pulizia in testa o backfill prima del primo istante); cancellazioni o inserimenti
+    a metà dell'intervallo già indicizzato non vengono rilevati.
+    Con gap < min_gap dell'indice il calcolo è fatto al volo e non viene salvato.
+    """
+    if not _ok_ident(table) or not _ok_ident(time_col):
+        raise HTTPException(status_code=400, detail="Invalid identifiers")
+
+    path = _db_path(name)
+    if not path.exists():
+        raise HTTPException(status_code=404, detail="Database not found")
+    st = path.stat()
+    archive = _is_archive(path)
+    etag = file_etag(path, st) if archive else None
+    key = f"{path}|{table}|{time_col}|{settings.coverage_min_gap}"
+    state = _coverage_load(key)
+    use_index = gap >= (state["min_gap"] if state else settings.coverage_min_gap)
+    if use_index and state is not None and archive and state.get("etag") == etag:
+        return _coverage_result(table, time_col, gap, state)
+
+    texpr = _time_num_expr(time_col)
+    raw = texpr == time_col
+    db = await _connect_ro(path)
+    try:
+        info = await _table_columns(db, table)
+        if not info:
+            raise HTTPException(status_code=404, detail="Table not found")
+        if time_col not in {c for c, _ in info}:
+            raise HTTPException(status_code=400, detail="Invalid time_col")
+
+        if not use_index:
+            first, last, rows, last_count, breaks = await _coverage_scan(db, table, texpr, gap, None)
+            return _coverage_result(table, time_col, gap, {
+                "first": first, "last": last, "rows": rows, "breaks": breaks,
+            })
+
+        # DB live: si riparte dall'ultimo istante solo sullo stesso file (inode) e con lo stesso
+        # primo istante (MIN usa l'indice sulla colonna tempo)
+        since = None
+        if (state is not None and not archive and raw and state.get("ino") == st.st_ino
+                and state.get("last") is not None):
+            async with db.execute(f"SELECT MIN({texpr}) FROM {table}") as cur:
+                (tmin,) = await cur.fetchone()
+            if tmin is not None and float(tmin) == state["first"]:
+                since = state["last"]
+
+        if since is not None:
+            first, last, rows, last_count, breaks = await _coverage_scan(db, table, texpr, state["min_gap"], since)
+            if last is None:
+                since = None   # righe a t == last sparite: ricalcolo completo
+        if since is None:
+            min_gap = settings.coverage_min_gap
+            first, last, rows, last_count, breaks = await _coverage_scan(db, table, texpr, min_gap, None)
+    finally:
+        await db.close()
+
+    if since is not None:
+        # la riscansione da t >= since rilegge le righe a since già contate
+        added = rows - state["last_count"]
+        if added == 0 and last == state["last"]:
+            return _coverage_result(table, time_col, gap, state)   # invariato: niente salvataggio
+        state = dict(state, last=last, last_count=last_count, rows=state["rows"] + added,
+                     breaks=state["breaks"] + breaks)
+    else:
+        state = {"etag": etag, "ino": st.st_ino, "first": first, "last": last, "last_count": last_count,
+                 "rows": rows, "min_gap": min_gap, "breaks": breaks}
+    # risposta dai salti completi: il gap richiesto può essere sotto la soglia dopo il taglio
+    result = _coverage_result(table, time_col, gap, state)
+    breaks, min_gap = _cap_breaks(state["breaks"], state["min_gap"])
+    state = dict(state, breaks=breaks, min_gap=min_gap)
+    _coverage_remember(key, state)
+    await run_in_threadpool(_coverage_save, key, state)
+    return result
+
+def _coverage_result(table: str, time_col: str, gap: float, state: Dict[str, Any]) -> Dict[str, Any]:
+    # intervalli e buchi per il gap richiesto, filtrando i salti indicizzati
+    intervals: List[List[float]] = []
+    gaps = []
+    if state["first"] is not None:
+        start = state["first"]
+        for end, nxt in state["breaks"]:
+            if nxt - end > gap:
+                intervals.append([start, end])
+                gaps.append({"from": end, "to": nxt, "seconds": nxt - end})
+                start = nxt
+        intervals.append([start, state["last"]])
+    return {
+        "table": table,
+        "time_col": time_col,
+        "gap": gap,
+        "rows": state["rows"],
+        "first": state["first"],
+        "last": state["last"],
+        "intervals": intervals,
+        "gaps": gaps,
+    }
 
 class DbValidationError(Exception):
     pass
@@ -186,7 +536,7 @@ async def _ensure_table_and_columns(db: aiosqlite.Connection, table: str, cols:
             raise DbValidationError(f"Tabella/view '{table}' inesistente.")
 
     async with db.execute(f"PRAGMA table_info('{table}')") as cur:
-        have = {r["name"] async for r in cur}
+        have = {r[1] async for r in cur}
     missing = [c for c in cols if c not in have]
     if missing:
         raise DbValidationError(f"Colonne non trovate in '{table}': {', '.join(missing)}")
@@ -195,6 +545,11 @@ def _time_expr(time_col: str) -> str:
     # Se la colonna è già epoch numeric: usala; altrimenti converti ISO -> epoch sec
     return time_col if time_col == "timeEpoch" else f"strftime('%s',{time_col})"
 
+def _time_num_expr(time_col: str) -> str:
+    # come _time_expr, ma sempre numerico (strftime('%s') ritorna testo): per confronti con epoch
+    texpr = _time_expr(time_col)
+    return texpr if texpr == time_col else f"CAST({texpr} AS REAL)"
+
 
 
 # !! Quindi il problema era che async with db: non funziona su una connessione già aperta restituita da _connect_ro()
@@ -228,9 +583,6 @@ async def sample_rows(
 
     db = await _connect_ro(db_path)     # APRI (una sola volta)
     try:
-        # rows come dict-like
-        db.row_factory = aiosqlite.Row
-
         # Verifica tabella/colonne
         await _ensure_table_and_columns(db, table, [time_col, order_by])
 
@@ -246,6 +598,7 @@ async def sample_rows(
             """
             async with db.execute(sql, (limit, offset)) as cur:
                 rows = await cur.fetchall()
+                desc_cols = [d[0] for d in cur.description]
 
         elif bucket == "1h":
             sql = f"""
@@ -265,6 +618,7 @@ async def sample_rows(
             """
             async with db.execute(sql, (limit, offset)) as cur:
                 rows = await cur.fetchall()
+                desc_cols = [d[0] for d in cur.description]
 
         elif bucket == "24h":
             sql = f"""
@@ -284,19 +638,19 @@ async def sample_rows(
             """
             async with db.execute(sql, (limit, offset)) as cur:
                 rows = await cur.fetchall()
+                desc_cols = [d[0] for d in cur.description]
 
         else:
             raise DbValidationError("Valore 'bucket' non valido. Usa: none, 1h, 24h.")
 
+        # tuple così come arrivano da sqlite (niente Row/re-indicizzazione per nome)
         if rows:
-            cols = list(rows[0].keys())
-            data_rows = [[r[c] for c in cols] for r in rows]
+            cols = desc_cols
         else:
             async with db.execute(f"PRAGMA table_info('{table}')") as cur:
-                cols = [r["name"] async for r in cur]
-            data_rows = []
+                cols = [r[1] async for r in cur]
 
-        return {"columns": cols, "rows": data_rows}
+        return {"columns": cols, "rows": rows}
 
     finally:
         await db.close()  # CHIUDI SEMPRE
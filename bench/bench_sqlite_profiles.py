@@ -0,0 +1,132 @@
+"""
+Benchmark profili di connessione SQLite (legacy vs archive/live).
+
+Crea un DB sintetico in una cartella temporanea (root + archives/) e misura,
+con la vecchia connessione (mode=ro&cache=shared, pragma di default) e con i
+nuovi profili:
+- get_chart() e sample_rows()
+- scan: aggregato su tutte le righe, tutto lato SQLite
+- scan xN: N scan concorrenti sullo stesso file
+L'ordine legacy/profile è casuale a ogni giro; si riportano le mediane.
+
+Uso:
+    python -m bench.bench_sqlite_profiles [--rows 500000] [--cols 8] [--repeat 7] [--readers 8]
+"""
+import argparse
+import asyncio
+import os
+import random
+import shutil
+import sqlite3
+import statistics
+import tempfile
+import time
+from pathlib import Path
+
+TMP = Path(tempfile.mkdtemp(prefix="ldc-bench-"))
+os.environ["DATA_BASE_DIR"] = str(TMP)  # prima di importare app.*
+
+import aiosqlite  # noqa: E402
+from app.services import sqlite_service  # noqa: E402
+
+
+def _make_db(path: Path, rows: int, ncols: int) -> None:
+    cols = [f"p{i}" for i in range(ncols)]
+    con = sqlite3.connect(path)
+    con.execute(f"CREATE TABLE measures (timeEpoch REAL, {', '.join(c + ' REAL' for c in cols)})")
+    con.execute("CREATE INDEX idx_measures_time ON measures(timeEpoch)")
+    t0 = 1_700_000_000
+    batch = []
+    for i in range(rows):
+        batch.append((t0 + i * 10,) + tuple(float((i * (k + 1)) % 997) for k in range(ncols)))
+        if len(batch) >= 10000:
+            con.executemany(f"INSERT INTO measures VALUES ({', '.join('?' * (ncols + 1))})", batch)
+            batch.clear()
+    if batch:
+        con.executemany(f"INSERT INTO measures VALUES ({', '.join('?' * (ncols + 1))})", batch)
+    con.commit()
+    con.close()
+
+
+async def _legacy_connect(path: Path) -> aiosqlite.Connection:
+    return await aiosqlite.connect(f"file:{path}?mode=ro&cache=shared", uri=True, timeout=5.0)
+
+
+async def _agg_scan(name: str, ycols) -> None:
+    # scansione completa lato SQLite (niente righe verso Python): isola l'effetto di pragma/mmap
+    db = await sqlite_service._connect_ro(sqlite_service._db_path(name))
+    try:
+        async with db.execute(f"SELECT {', '.join(f'SUM({c})' for c in ycols)} FROM measures") as cur:
+            await cur.fetchone()
+    finally:
+        await db.close()
+
+
+def _cases(name: str, ycols, readers: int) -> dict:
+    def chart():
+        return sqlite_service.get_chart(name, "measures", "timeEpoch", ycols, None, None)
+
+    def sample():
+        return sqlite_service.sample_rows(name, "measures", "timeEpoch", "1h", "timeEpoch", True, 5000, 0)
+
+    async def concurrent():
+        # N lettori sullo stesso file nello stesso momento (cache=shared li serializza)
+        await asyncio.gather(*(_agg_scan(name, ycols) for _ in range(readers)))
+
+    return {"chart": chart, "sample": sample, "scan": lambda: _agg_scan(name, ycols), f"scan x{readers}": concurrent}
+
+
+async def _time(fn) -> float:
+    t = time.perf_counter()
+    await fn()
+    return time.perf_counter() - t
+
+
+async def main(rows: int, ncols: int, repeat: int, readers: int) -> None:
+    (TMP / "archives").mkdir()
+    _make_db(TMP / "live.db", rows, ncols)
+    shutil.copy(TMP / "live.db", TMP / "archives" / "archive.db")
+    ycols = [f"p{i}" for i in range(ncols)]
+
+    profiled = sqlite_service._connect_ro
+    modes = {"legacy": _legacy_connect, "profile": profiled}
+    results = {}
+    rnd = random.Random(0)
+    try:
+        for name in ("live.db", "archive.db"):
+            for case, fn in _cases(name, ycols, readers).items():
+                for mode, conn in modes.items():   # warm-up (page cache) per entrambe
+                    sqlite_service._connect_ro = conn
+                    await fn()
+                samples = {m: [] for m in modes}
+                for _ in range(repeat):
+                    # ordine casuale a ogni giro: niente vantaggio sistematico per chi va prima
+                    order = list(modes)
+                    rnd.shuffle(order)
+                    for mode in order:
+                        sqlite_service._connect_ro = modes[mode]
+                        samples[mode].append(await _time(fn))
+                for mode, ts in samples.items():
+                    results[(name, case, mode)] = statistics.median(ts)
+    finally:
+        sqlite_service._connect_ro = profiled
+
+    print(f"rows={rows} cols={ncols} repeat={repeat} readers={readers} (mediane, secondi)")
+    print(f"{'file':<12}{'case':<12}{'legacy':>10}{'profile':>10}{'ratio':>8}")
+    for name in ("live.db", "archive.db"):
+        for case in _cases(name, ycols, readers):
+            lg, pr = results[(name, case, "legacy")], results[(name, case, "profile")]
+            print(f"{name:<12}{case:<12}{lg:>10.4f}{pr:>10.4f}{pr / lg:>8.2f}")
+
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--rows", type=int, default=500_000)
+    ap.add_argument("--cols", type=int, default=8)
+    ap.add_argument("--repeat", type=int, default=7)
+    ap.add_argument("--readers", type=int, default=8)
+    a = ap.parse_args()
+    try:
+        asyncio.run(main(a.rows, a.cols, a.repeat, a.readers))
+    finally:
+        shutil.rmtree(TMP, ignore_errors=True)